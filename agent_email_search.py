@@ -2,13 +2,16 @@
 
 import argparse
 import asyncio
-import json
+import hashlib
 import os
+import shutil
 import time
+from collections import defaultdict
 from urllib.parse import quote_plus
 
 import aiofiles
 import aiohttp
+import numpy as np
 import pandas as pd
 from aiohttp import ClientSession, TCPConnector
 from dotenv import load_dotenv
@@ -17,6 +20,13 @@ from tqdm import tqdm
 # Load environment variables
 load_dotenv()
 
+SEARCH_LOCATION = 'United States'
+SEARCH_URL = (
+    "https://api.hasdata.com/scrape/google/serp?"
+    "q={query}&location={location}&deviceType=desktop&gl=us&hl=en&num={num_results}"
+)
+ENCODED_LOCATION = quote_plus(SEARCH_LOCATION)
+
 
 async def main():
     parser = argparse.ArgumentParser(description='Agent Email Search Utility')
@@ -26,6 +36,9 @@ async def main():
     parser.add_argument('--output_dir',
                         default='data/raw_google_searches',
                         help='Directory to save the search result JSON files')
+    parser.add_argument('--cache_dir',
+                        default='data/serp_cache',
+                        help='Directory to cache search results by query')
     parser.add_argument('--max_concurrent_requests',
                         type=int,
                         default=15,
@@ -39,11 +52,13 @@ async def main():
 
     input_dir = args.input_dir
     output_dir = args.output_dir
+    cache_dir = args.cache_dir
     max_concurrent_requests = args.max_concurrent_requests
 
     if not os.path.exists(output_dir):
         os.makedirs(output_dir)
         print(f"Created directory: {output_dir}")
+    os.makedirs(cache_dir, exist_ok=True)
 
     # Get list of all CSV files in the input directory
     csv_files = [f for f in os.listdir(input_dir) if f.endswith('.csv')]
@@ -51,6 +66,31 @@ async def main():
         print(f"No CSV files found in {input_dir}")
         return
 
+    # Index existing results once; searches add to it as they complete
+    existing_files = {
+        entry.name[:-len('.json')] for entry in os.scandir(output_dir)
+        if entry.name.endswith('.json')
+    }
+
+    # Share one connection pool across all CSV files so keep-alive
+    # connections and DNS lookups are reused between them
+    connector = TCPConnector(limit=0,
+                             limit_per_host=max_concurrent_requests,
+                             keepalive_timeout=75,
+                             ttl_dns_cache=300,
+                             enable_cleanup_closed=True)
+    timeout = aiohttp.ClientTimeout(total=60)
+    headers = {'x-api-key': api_key, 'Content-Type': "application/json"}
+    async with ClientSession(connector=connector,
+                             timeout=timeout,
+                             headers=headers) as session:
+        await process_csv_files(csv_files, input_dir, output_dir, cache_dir,
+                                existing_files, session,
+                                max_concurrent_requests)
+
+
+async def process_csv_files(csv_files, input_dir, output_dir, cache_dir,
+                            existing_files, session, max_concurrent_requests):
     # Process each CSV file sequentially
     for csv_file in csv_files:
         print(f"\nProcessing {csv_file}...")
@@ -71,14 +111,15 @@ async def main():
         df_agents['id'] = df_agents['id'].astype(str)
 
         # Generate search tuples
-        search_tuples = generate_search_tuples(df_agents, output_dir)
+        search_tuples = generate_search_tuples(df_agents, existing_files)
 
         if not search_tuples:
             print("No new agents to search for in this file")
             continue
 
         # Perform searches asynchronously
-        results = await async_search(search_tuples, api_key, output_dir,
+        results = await async_search(search_tuples, output_dir, cache_dir,
+                                     existing_files, session,
                                      max_concurrent_requests)
 
         # Print results
@@ -87,60 +128,61 @@ async def main():
             print(result)
 
 
-def generate_search_query(row):
-    # Same as before
-    name = row['Name'].strip() if pd.notna(row['Name']) else ''
-    company = row['Company'].strip() if pd.notna(row['Company']) else ''
-    city = row['City'].strip() if pd.notna(row['City']) else ''
-    zipcode = row['Zipcode'].strip() if pd.notna(row['Zipcode']) else ''
-    county = row['County'].strip() if pd.notna(row['County']) else ''
+def build_queries(df):
+    # Build every agent's query at once with vectorized string ops
+    queries = pd.Series('', index=df.index)
+    for column in ('Name', 'Company', 'City'):
+        values = df[column].fillna('').astype(str).str.strip()
+        queries += np.where(values != '', '"' + values + '" ', '')
 
-    query_parts = []
+    return queries + '(email OR contact)'
 
-    if name:
-        query_parts.append(f'"{name}"')
 
-    if company:
-        query_parts.append(f'"{company}"')
+def encode_query(query):
+    # Drop non-ASCII characters and URL-encode the query
+    return quote_plus(query.encode('ascii', errors='ignore').decode())
 
-    if city:
-        query_parts.append(f'"{city}"')
 
-    query_parts.append('(email OR contact)')
+def generate_search_tuples(df, existing_files):
+    # Drop agents that already have results before building any query.
+    # Probing the set directly keeps this O(len(df)); Series.isin would
+    # rebuild a hash table of every existing result for each CSV file.
+    pending = np.fromiter(
+        (agent_uuid not in existing_files for agent_uuid in df['id']),
+        dtype=bool,
+        count=len(df))
+    skipped_count = int((~pending).sum())
+    df = df.loc[pending]
 
-    return ' '.join(query_parts)
+    # Encode queries here so searches only have to format the request URL
+    encoded_queries = [encode_query(query) for query in build_queries(df)]
 
-
-def generate_search_tuples(df, output_dir):
-    existing_files = {
-        f.replace('.json', '')
-        for f in os.listdir(output_dir) if f.endswith('.json')
-    }
-    search_tuples = []
-    skipped_count = 0
-
-    for _, row in df.iterrows():
-        agent_uuid = row['id']
-        if agent_uuid in existing_files:
-            skipped_count += 1
-            continue
-
-        query = generate_search_query(row)
-        search_tuples.append((agent_uuid, query))
+    # Agents with identical queries (same name, company and city) share
+    # a single search
+    agents_by_query = defaultdict(list)
+    for agent_uuid, encoded_query in zip(df['id'], encoded_queries):
+        agents_by_query[encoded_query].append(agent_uuid)
+    search_tuples = list(agents_by_query.items())
 
     print(
         f"\nSkipping {skipped_count} agents that already have search results")
-    print(f"Will search for {len(search_tuples)} new agents")
+    print(f"Will search for {len(df)} new agents "
+          f"with {len(search_tuples)} unique queries")
     return search_tuples
 
 
-async def fetch(session, url, headers, max_retries=3):
+async def fetch(session, url, filepath, max_retries=3, chunk_size=65536):
+    # Stream the raw response body to disk without decoding or parsing it;
+    # downstream cleaning parses the JSON anyway
     for attempt in range(max_retries):
         try:
-            async with session.get(url, headers=headers,
-                                   timeout=30) as response:
+            async with session.get(url, timeout=30) as response:
                 response.raise_for_status()
-                return await response.text()
+                async with aiofiles.open(filepath, 'wb') as f:
+                    async for chunk in response.content.iter_chunked(
+                            chunk_size):
+                        await f.write(chunk)
+                return
         except aiohttp.ClientError as e:
             if attempt == max_retries - 1:
                 raise Exception(
@@ -150,58 +192,78 @@ async def fetch(session, url, headers, max_retries=3):
             await asyncio.sleep(wait_time)
 
 
-async def search(agent_uuid, query, api_key, output_dir, session):
-    filename = f"{agent_uuid}.json"
-    filepath = os.path.join(output_dir, filename)
+def cache_key(encoded_query):
+    key = f"{encoded_query}\n{SEARCH_LOCATION}".encode('utf-8')
+    return hashlib.blake2b(key, digest_size=16).hexdigest()
+
 
+def link_result(source, destination):
+    # Hard-link to avoid duplicating identical results on disk, falling back
+    # to a copy when the cache lives on a different filesystem
     try:
-        # Encode query to handle special characters
-        encoded_query = query.encode('ascii', errors='ignore').decode()
-        encoded_query = quote_plus(encoded_query)
-        location = quote_plus('United States')
-        num_results = 10
-        url = (
-            f"https://api.hasdata.com/scrape/google/serp?"
-            f"q={encoded_query}&location={location}&deviceType=desktop&gl=us&hl=en&num={num_results}"
-        )
-
-        headers = {'x-api-key': api_key, 'Content-Type': "application/json"}
-
-        data = await fetch(session, url, headers)
-        search_results = json.loads(data)
-
-        async with aiofiles.open(filepath, 'w', encoding='utf-8') as f:
-            await f.write(
-                json.dumps(search_results, ensure_ascii=False, indent=2))
-
-        return f"Completed search for agent_uuid: {agent_uuid}"
+        os.link(source, destination)
+    except OSError:
+        shutil.copyfile(source, destination)
+
+
+async def search(encoded_query, agent_uuids, output_dir, cache_dir,
+                 existing_files, session):
+    cache_path = os.path.join(cache_dir, f"{cache_key(encoded_query)}.json")
+
+    try:
+        if not os.path.exists(cache_path):
+            await fetch_search_results(encoded_query, cache_path, session)
+
+        for agent_uuid in agent_uuids:
+            filepath = os.path.join(output_dir, f"{agent_uuid}.json")
+            link_result(cache_path, filepath)
+            existing_files.add(agent_uuid)
+
+        return f"Completed search for agent_uuids: {', '.join(agent_uuids)}"
     except Exception as e:
-        print(f"Error processing agent_uuid {agent_uuid}: {str(e)}")
+        print(f"Error processing agent_uuids {', '.join(agent_uuids)}: {str(e)}")
         # Return error message but don't raise exception to avoid stopping process
-        return f"Error processing agent_uuid {agent_uuid}: {str(e)}"
+        return f"Error processing agent_uuids {', '.join(agent_uuids)}: {str(e)}"
 
 
-async def async_search(search_tuples, api_key, output_dir,
-                       max_concurrent_requests):
-    connector = TCPConnector(limit_per_host=max_concurrent_requests)
-    timeout = aiohttp.ClientTimeout(total=60)
-    async with ClientSession(connector=connector, timeout=timeout) as session:
-        tasks = []
-        for agent_uuid, query in search_tuples:
-            task = asyncio.ensure_future(
-                search(agent_uuid, query, api_key, output_dir, session))
-            tasks.append(task)
-
-        results = []
-        for f in asyncio.as_completed(tasks):
-            try:
-                result = await f
-                results.append(result)
-            except Exception as e:
-                print(f"Task failed: {str(e)}")
-                # Continue processing remaining tasks even if one fails
-                continue
-        return results
+async def fetch_search_results(encoded_query, filepath, session):
+    url = SEARCH_URL.format(query=encoded_query,
+                            location=ENCODED_LOCATION,
+                            num_results=10)
+
+    # Write to a temporary file first so an interrupted run never leaves a
+    # truncated entry behind in the cache
+    tmp_path = f"{filepath}.tmp"
+    await fetch(session, url, tmp_path)
+    os.replace(tmp_path, filepath)
+
+
+async def async_search(search_tuples, output_dir, cache_dir, existing_files,
+                       session, max_concurrent_requests):
+    semaphore = asyncio.Semaphore(max_concurrent_requests)
+
+    with tqdm(total=len(search_tuples), desc="Searching agents") as pbar:
+
+        async def bounded_search(encoded_query, agent_uuids):
+            async with semaphore:
+                result = await search(encoded_query, agent_uuids, output_dir,
+                                      cache_dir, existing_files, session)
+            pbar.update(1)
+            return result
+
+        outcomes = await asyncio.gather(
+            *(bounded_search(encoded_query, agent_uuids)
+              for encoded_query, agent_uuids in search_tuples),
+            return_exceptions=True)
+
+    results = []
+    for outcome in outcomes:
+        if isinstance(outcome, Exception):
+            # Continue processing remaining tasks even if one fails
+            print(f"Task failed: {str(outcome)}")
+            continue
+        results.append(outcome)
+    return results
 
 
 if __name__ == "__main__":
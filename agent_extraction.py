@@ -0,0 +1,204 @@
+import csv
+import os
+import re
+from typing import List, Optional
+
+import orjson
+from openai.lib._pydantic import to_strict_json_schema
+from pydantic import BaseModel, Field, TypeAdapter
+
+PATH_INPUT = 'data/realtor_agents_enhanced'
+PATH_SEARCH_RESULTS = 'data/clean_google_searches'
+PATH_OUTPUT = 'data/parsed_search_results'
+
+# Agent CSV columns used to build the search query
+AGENT_COLUMNS = ('id', 'Name', 'Company', 'City', 'County')
+
+# Extraction from a handful of snippets is well within a small model; the
+# larger one only gets agents the small one comes back empty-handed on
+MODEL = os.getenv('EXTRACT_MODEL', 'gpt-4o-mini')
+FALLBACK_MODEL = 'gpt-4o'
+RE_EMAIL = re.compile(r'[\w.+-]+@[\w-]+\.[\w.-]+')
+SYSTEM_PROMPT = "You're a master at finding relevant real estate agent information. You stick to the provided Google search data, and only if explicitly available extract data as valid JSON according to the provided schema."
+SYSTEM_MESSAGE = {"role": "system", "content": SYSTEM_PROMPT}
+
+MAX_TOKENS = 4096
+
+
+class AgentData(BaseModel):
+    email: Optional[str] = Field(
+        None,
+        description="The most relevant real estate agent's professional email address, if available"
+    )
+    other_emails: Optional[List[str]] = Field(
+        None,
+        description="Any other email addresses found for the real estate agent or its brokerage firm"
+    )
+    possible_email: Optional[str] = Field(
+        None,
+        description="The most likely email address for the real estate agent if its main email is not available"
+    )
+    phone: Optional[str] = Field(
+        None,
+        description="The most relevant real estate agent's professional phone number or its brokerage firm, if available"
+    )
+    other_phones: Optional[List[str]] = Field(
+        None,
+        description="Any other contact phone numbers for the real estate agent"
+    )
+    city: Optional[str] = Field(
+        None,
+        description="The city where the real estate agent primarily operates"
+    )
+    age: Optional[int] = Field(
+        None, description="The age of the real estate agent, if available"
+    )
+    gender: Optional[str] = Field(
+        None, description="The gender of the real estate agent, if available"
+    )
+    website: Optional[str] = Field(
+        None,
+        description="The real estate agent's professional website or listing page"
+    )
+    social_media: Optional[List[str]] = Field(
+        None,
+        description="List of social media profiles related to the agent's real estate business"
+    )
+    google_review_star_rating: Optional[float] = Field(
+        None,
+        description="The Google review star rating of the real estate agent or the brokerage firm, if available"
+    )
+    most_recent_reviews: Optional[List[str]] = Field(
+        None,
+        description="The most recent reviews of the real estate agent, if available"
+    )
+    additional_info: Optional[str] = Field(
+        None,
+        description="Relevant information about the real estate agent or their practice that might be interesting to know before contacting them with a personalized message so that they are more likely to respond"
+    )
+
+
+# The JSON files are small, so open, read and parse each one in a single
+# worker-thread hop rather than one hop per file operation
+def read_json(path):
+    with open(path, 'rb') as f:
+        return orjson.loads(f.read())
+
+
+def write_json(path, obj):
+    # Write to a temporary file first so a killed run never leaves a
+    # truncated output behind that would mark the agent as processed
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(orjson.dumps(obj, option=orjson.OPT_INDENT_2))
+    os.replace(tmp_path, path)
+
+
+def load_processed_agents():
+    if not os.path.exists(PATH_OUTPUT):
+        os.makedirs(PATH_OUTPUT)
+        print(f"Created directory: {PATH_OUTPUT}")
+    else:
+        print(f"Directory already exists: {PATH_OUTPUT}")
+
+    # Ids of agents that already have an output file
+    with os.scandir(PATH_OUTPUT) as entries:
+        return {entry.name.partition('.')[0] for entry in entries if entry.name.endswith('.json')}
+
+
+def strict_response_format(model_type):
+    # The strict json_schema response_format the SDK's parse() helpers send.
+    # Only the schema conversion comes from the SDK (openai is pinned in
+    # requirements.txt), so an upgrade that moves it breaks in this one place
+    return {
+        "type": "json_schema",
+        "json_schema": {
+            "name": model_type.__name__,
+            "schema": to_strict_json_schema(model_type),
+            "strict": True,
+        },
+    }
+
+
+# Part of the cache key, so changing AgentData invalidates cached answers
+AGENT_DATA_SCHEMA = AgentData.model_json_schema()
+# Strict response_format and validator built once from AgentData, so requests
+# skip the SDK's per-call parse() helpers
+RESPONSE_FORMAT = strict_response_format(AgentData)
+AGENT_DATA_ADAPTER = TypeAdapter(AgentData)
+
+
+def prune_empty(value):
+    # Drop empty fields and inline base64 images, which cost many tokens and
+    # carry nothing the model can read
+    if isinstance(value, dict):
+        value = {k: prune_empty(v) for k, v in value.items()}
+        return {k: v for k, v in value.items() if v not in (None, '', [], {})}
+    if isinstance(value, list):
+        value = [prune_empty(v) for v in value]
+        return [v for v in value if v not in (None, '', [], {})]
+    if isinstance(value, str) and value.startswith('data:image'):
+        return None
+    return value
+
+
+def compact_search_results(google_search_results):
+    compact = []
+    for result in google_search_results:
+        if result.get('type') == 'organic':
+            # highlighted_words only repeats words from the snippet
+            result = {key: result.get(key) for key in ('title', 'link', 'source', 'snippet')}
+        compact.append(prune_empty(result))
+    return compact
+
+
+def build_messages(user_prompt):
+    return [SYSTEM_MESSAGE, {"role": "user", "content": user_prompt}]
+
+
+def build_user_prompt(search_query, google_search_results):
+    # Compact JSON instead of the Python repr of the results keeps the prompt short
+    results = orjson.dumps(compact_search_results(google_search_results)).decode()
+    return f"When searching for the following real estate agent on Google: {search_query}, we got these results:\n{results}.\nExtract the relevant information found as valid JSON:"
+
+
+def needs_fallback(agent_data, user_prompt):
+    # Nothing usable came back, or no contact details although the search
+    # results plainly contain an email address
+    if agent_data is None:
+        return True
+    return not (agent_data.email or agent_data.phone) and RE_EMAIL.search(user_prompt) is not None
+
+
+def build_search_query(row):
+    name = row['Name']
+    firm_name = row['Company']
+    city = row['City']
+    county = row['County']
+
+    search_query_dict = {
+        "name": name,
+        "firm_name": firm_name,
+        "city": city,
+        "county": county,
+        "state": "North Dakota"
+    }
+
+    search_query_dict = {k: v for k, v in search_query_dict.items() if v}
+    search_query_dict["keyword"] = "real estate"
+    return " ".join(search_query_dict.values()).strip()
+
+
+def load_agent_rows(csv_file):
+    # Plain dict rows with only the columns used to build the search query;
+    # empty cells come back as '' rather than NaN
+    with open(csv_file, newline='', encoding='utf-8') as f:
+        reader = csv.DictReader(f)
+        missing = set(AGENT_COLUMNS) - set(reader.fieldnames or AGENT_COLUMNS)
+        if missing:
+            raise ValueError(f"Missing columns: {', '.join(sorted(missing))}")
+        rows = [{column: row[column] for column in AGENT_COLUMNS} for row in reader]
+
+    if not rows:
+        print(f"CSV file {csv_file} is empty.")
+    return rows
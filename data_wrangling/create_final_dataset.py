@@ -16,9 +16,11 @@
 
 # %%
 import pandas as pd
-import json
+import orjson
 import glob
 import os
+import pyarrow as pa
+import pyarrow.dataset as ds
 
 # %%
 PATH_REALTORS = '../data/kirwood_ca/realtor_agents_enhanced'
@@ -27,23 +29,31 @@ PATH_OUTPUT = '../data/kirwood_ca/final_dataset.csv'
 PATH_OUTPUT_EMAILS = '../data/kirwood_ca/final_dataset_emails.csv'
 
 # %%
+# Fields written by agent_extraction.AgentData, plus the agent id
+SEARCH_RESULTS_SCHEMA = (
+    'email', 'other_emails', 'possible_email', 'phone', 'other_phones', 'city',
+    'age', 'gender', 'website', 'social_media', 'google_review_star_rating',
+    'most_recent_reviews', 'additional_info', 'id'
+)
+
 search_results_files = glob.glob(f'{PATH_SEARCH_RESULTS}/*.json')
-search_results_data = []
+search_results_data = {column: [] for column in SEARCH_RESULTS_SCHEMA}
 
 for file_path in search_results_files:
     file_id = os.path.splitext(os.path.basename(file_path))[0]
-    with open(file_path, 'r') as f:
+    with open(file_path, 'rb') as f:
         try:
-            data = json.load(f)
-        except json.JSONDecodeError:
+            data = orjson.loads(f.read())
+        except orjson.JSONDecodeError:
             print(f"Error decoding JSON from {file_path}, skipping...")
             continue
     
     # Add ID to data
     data['id'] = file_id
     
-    # Append to list
-    search_results_data.append(data)
+    # Append each field to its column
+    for column in SEARCH_RESULTS_SCHEMA:
+        search_results_data[column].append(data.get(column))
 
 # Create DataFrame
 df_search_results = pd.DataFrame(search_results_data)
@@ -67,8 +77,14 @@ print(f"Percentage of records with any type of email: {any_email_percentage:.2f}
 # Read all realtor files
 realtor_files = glob.glob(f'{PATH_REALTORS}/*.csv')
 
-# Create DataFrame by concatenating all CSV files
-df_realtors = pd.concat([pd.read_csv(f) for f in realtor_files], ignore_index=True)
+# Scan all CSV files as one Arrow dataset, parsed in parallel by Arrow's
+# thread pool. Every column is read as a string so that files where a column
+# happens to be empty or numeric-looking don't conflict with the others.
+realtor_columns = pd.read_csv(realtor_files[0], nrows=0).columns
+realtor_schema = pa.schema([(column, pa.string()) for column in realtor_columns])
+df_realtors = ds.dataset(
+    realtor_files, format='csv', schema=realtor_schema
+).to_table().to_pandas()
 
 # Reset index and ensure id column exists in both dataframes
 df_realtors = df_realtors.reset_index(drop=True)
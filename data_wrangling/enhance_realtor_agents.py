@@ -1,5 +1,6 @@
 import glob
 import os
+from concurrent.futures import ProcessPoolExecutor
 
 import pandas as pd
 
@@ -7,19 +8,30 @@ PATH_DATA = 'data/realtor_agents'
 PATH_ZIPCODES = 'config/usa_zipcodes.csv'
 PATH_OUTPUT = 'data/realtor_agents_enhanced'
 
-# Create output directory if it doesn't exist
-os.makedirs(PATH_OUTPUT, exist_ok=True)
+# Zipcode -> location lookup, set in each worker by init_worker
+zipcode_locations = None
 
-# Load zipcode reference data
-zipcodes_df = pd.read_csv(PATH_ZIPCODES, sep=';')
-# Select only needed columns
-zipcodes_df = zipcodes_df[[
-    'Zip Code', 'Official USPS city name', 'Primary Official County Name'
-]]
-zipcodes_df['Zip Code'] = zipcodes_df['Zip Code'].astype(str).str.zfill(5)
 
-# Process each agent file
-for file_path in glob.glob(os.path.join(PATH_DATA, 'agents_info_*.csv')):
+def load_zipcode_locations():
+    # Load zipcode reference data
+    zipcodes_df = pd.read_csv(PATH_ZIPCODES, sep=';')
+    # Select only needed columns
+    zipcodes_df = zipcodes_df[[
+        'Zip Code', 'Official USPS city name', 'Primary Official County Name'
+    ]]
+    zipcodes_df['Zip Code'] = zipcodes_df['Zip Code'].astype(str).str.zfill(5)
+    # Index by zipcode once so each agent file is a hash lookup, not a table scan
+    return zipcodes_df.drop_duplicates('Zip Code').set_index(
+        'Zip Code').to_dict('index')
+
+
+def init_worker(locations):
+    # Ship the lookup table once per worker rather than once per task
+    global zipcode_locations
+    zipcode_locations = locations
+
+
+def process_file(file_path):
     # Extract zipcode from filename
     filename = os.path.basename(file_path)
     zipcode = filename.split('_')[-1].split('.')[0]
@@ -29,7 +41,7 @@ for file_path in glob.glob(os.path.join(PATH_DATA, 'agents_info_*.csv')):
     agents_df = pd.read_csv(file_path)
 
     # Get location data for this zipcode
-    location_data = zipcodes_df[zipcodes_df['Zip Code'] == zipcode].iloc[0]
+    location_data = zipcode_locations[zipcode]
 
     # Add location columns to all rows
     agents_df['Zipcode'] = zipcode
@@ -40,4 +52,17 @@ for file_path in glob.glob(os.path.join(PATH_DATA, 'agents_info_*.csv')):
     output_filename = os.path.join(PATH_OUTPUT, filename)
     agents_df.to_csv(output_filename, index=False)
 
-print("Processing complete. Enhanced files saved to:", PATH_OUTPUT)
+
+if __name__ == '__main__':
+    # Create output directory if it doesn't exist
+    os.makedirs(PATH_OUTPUT, exist_ok=True)
+
+    locations = load_zipcode_locations()
+    files = glob.glob(os.path.join(PATH_DATA, 'agents_info_*.csv'))
+
+    # Each agent file is independent, so process them in parallel
+    with ProcessPoolExecutor(initializer=init_worker,
+                             initargs=(locations,)) as executor:
+        list(executor.map(process_file, files, chunksize=8))
+
+    print("Processing complete. Enhanced files saved to:", PATH_OUTPUT)
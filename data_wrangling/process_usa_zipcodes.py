@@ -42,8 +42,8 @@ df.state_code.unique()
 if not os.path.exists('config/zipcodes'):
     os.makedirs('config/zipcodes')
 
-for state in df['state_code'].unique():
-    state_df = df[df['state_code'] == state]
+# Partition the table in a single pass instead of one mask per state
+for state, state_df in df.groupby('state_code', sort=False):
     state_df.to_csv(f'config/zipcodes/{state}.csv', index=False)
 
 # %%
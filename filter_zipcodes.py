@@ -1,9 +1,27 @@
 import argparse
+import json
 import os
 import sys
 
+import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
 
+# Only these columns are used for filtering and output
+ZIPCODE_DTYPES = {
+    'zipcode': 'string',
+    'state_code': 'string',
+    'city': 'string',
+    'county_name': 'string',
+    'population': 'float64',
+    'density': 'float64',
+}
+
+# Bump whenever load_zipcode_data changes what it returns, so caches built by
+# older code are rebuilt
+ZIPCODE_CACHE_VERSION = 2
+ZIPCODE_CACHE_METADATA_KEY = b'harvest_agents.zipcode_source'
 
 def load_zipcode_data(zipcodes_dir):
     # Load all CSV files in the specified directory
@@ -11,30 +29,80 @@ def load_zipcode_data(zipcodes_dir):
     for filename in os.listdir(zipcodes_dir):
         if filename.endswith('.csv'):
             filepath = os.path.join(zipcodes_dir, filename)
-            df = pd.read_csv(filepath, dtype={'zipcode': str})
+            df = pd.read_csv(filepath, engine='pyarrow', usecols=list(ZIPCODE_DTYPES), dtype=ZIPCODE_DTYPES)
             data_frames.append(df)
     if not data_frames:
         raise ValueError("No CSV files found in the specified directory.")
     # Concatenate all data frames into one
-    return pd.concat(data_frames, ignore_index=True)
+    df = pd.concat(data_frames, ignore_index=True)
+    # A few dozen distinct codes, so store them uppercased as a category and
+    # compare the small integer codes instead of every string
+    df['state_code'] = df['state_code'].str.upper().astype('category')
+    # Lowercase once here so name filters are plain substring searches
+    df['city_lower'] = df['city'].str.lower()
+    df['county_name_lower'] = df['county_name'].str.lower()
+    return df
+
+def zipcode_source_signature(zipcodes_dir):
+    # What a cached frame was built from: loader version, directory and the
+    # name, mtime and size of every CSV in it
+    zipcodes_dir = os.path.realpath(zipcodes_dir)
+    files = {}
+    with os.scandir(zipcodes_dir) as entries:
+        for entry in entries:
+            if entry.name.endswith('.csv'):
+                stat = entry.stat()
+                files[entry.name] = [stat.st_mtime_ns, stat.st_size]
+    return {'version': ZIPCODE_CACHE_VERSION, 'zipcodes_dir': zipcodes_dir, 'files': files}
+
+def load_zipcode_data_cached(zipcodes_dir, cache_file):
+    # Reuse the Parquet cache only if it was built by this loader version from
+    # the same directory and exactly the same CSV files
+    signature = zipcode_source_signature(zipcodes_dir)
+    if os.path.exists(cache_file):
+        metadata = pq.read_schema(cache_file).metadata or {}
+        cached_signature = metadata.get(ZIPCODE_CACHE_METADATA_KEY)
+        if cached_signature is not None and json.loads(cached_signature) == signature:
+            return pd.read_parquet(cache_file, engine='pyarrow')
+
+    df = load_zipcode_data(zipcodes_dir)
+    cache_dir = os.path.dirname(cache_file)
+    if cache_dir:
+        os.makedirs(cache_dir, exist_ok=True)
+    # Store the signature in the file's own metadata so data and signature
+    # are always written together
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    table = table.replace_schema_metadata({
+        **(table.schema.metadata or {}),
+        ZIPCODE_CACHE_METADATA_KEY: json.dumps(signature),
+    })
+    tmp_file = f"{cache_file}.tmp"
+    pq.write_table(table, tmp_file, compression='zstd')
+    os.replace(tmp_file, cache_file)
+    return df
 
 def filter_zipcodes(df, state=None, city=None, county_name=None, min_population=None, max_population=None, min_density=None, max_density=None):
-    # Apply filters based on the provided arguments
+    # Combine all provided filters into one mask and slice the frame once
+    conditions = []
     if state:
-        df = df[df['state_code'].str.upper() == state.upper()]
+        conditions.append(df['state_code'] == state.upper())
     if city:
-        df = df[df['city'].str.contains(city, case=False, na=False)]
+        conditions.append(df['city_lower'].str.contains(city.lower(), na=False, regex=False))
     if county_name:
-        df = df[df['county_name'].str.contains(county_name, case=False, na=False)]
+        conditions.append(df['county_name_lower'].str.contains(county_name.lower(), na=False, regex=False))
     if min_population is not None:
-        df = df[df['population'] >= min_population]
+        conditions.append(df['population'] >= min_population)
     if max_population is not None:
-        df = df[df['population'] <= max_population]
+        conditions.append(df['population'] <= max_population)
     if min_density is not None:
-        df = df[df['density'] >= min_density]
+        conditions.append(df['density'] >= min_density)
     if max_density is not None:
-        df = df[df['density'] <= max_density]
-    return df
+        conditions.append(df['density'] <= max_density)
+
+    mask = np.ones(len(df), dtype=bool)
+    for condition in conditions:
+        mask &= condition.to_numpy(dtype=bool, na_value=False)
+    return df.loc[mask]
 
 def main():
     parser = argparse.ArgumentParser(description='Filter zipcodes based on various criteria.')
@@ -46,20 +114,17 @@ def main():
     parser.add_argument('--max_population', type=float, help='Maximum population to filter by.')
     parser.add_argument('--min_density', type=float, help='Minimum density to filter by.')
     parser.add_argument('--max_density', type=float, help='Maximum density to filter by.')
+    parser.add_argument('--cache_file', default='data/zipcodes.parquet', help='Parquet file caching the loaded zipcode data.')
     parser.add_argument('--output_file', default='filtered_zipcodes.txt', help='Output file to save the list of zipcodes.')
     args = parser.parse_args()
 
     # Load zipcode data
     try:
-        df = load_zipcode_data(args.zipcodes_dir)
+        df = load_zipcode_data_cached(args.zipcodes_dir, args.cache_file)
     except ValueError as e:
         print(f"Error: {e}")
         sys.exit(1)
 
-    # Convert population and density columns to numeric, handling missing values
-    df['population'] = pd.to_numeric(df['population'], errors='coerce')
-    df['density'] = pd.to_numeric(df['density'], errors='coerce')
-
     # Filter zipcodes
     filtered_df = filter_zipcodes(
         df,
@@ -77,10 +142,9 @@ def main():
         sys.exit(0)
 
     # Save the list of zipcodes to the output file
-    zipcodes = filtered_df['zipcode'].dropna().unique()
-    with open(args.output_file, 'w') as f:
-        for zipcode in zipcodes:
-            f.write(f"{zipcode}\n")
+    # Deduplicate and write in one pass inside pandas, one zipcode per line
+    zipcodes = filtered_df['zipcode'].dropna().drop_duplicates()
+    zipcodes.to_csv(args.output_file, index=False, header=False)
 
     print(f"Filtered {len(zipcodes)} zipcodes. Saved to {args.output_file}")
 
@@ -0,0 +1,32 @@
+import hashlib
+import os
+
+import orjson
+
+PATH_CACHE = 'data/llm_cache'
+
+
+def make_key(model, system_prompt, user_prompt, schema):
+    # Identical requests (temperature is always 0) hash to the same key;
+    # the schema is part of the key so changing AgentData invalidates entries
+    payload = {"m": model, "t": 0, "sys": system_prompt, "usr": user_prompt, "schema": schema}
+    return hashlib.sha256(orjson.dumps(payload, option=orjson.OPT_SORT_KEYS)).hexdigest()
+
+
+def get_entry(key):
+    try:
+        with open(os.path.join(PATH_CACHE, f"{key}.json"), 'rb') as f:
+            return orjson.loads(f.read())
+    except (FileNotFoundError, orjson.JSONDecodeError):
+        return None
+
+
+def put_entry(key, value):
+    os.makedirs(PATH_CACHE, exist_ok=True)
+    path = os.path.join(PATH_CACHE, f"{key}.json")
+    # Write to a temporary file first so an interrupted run never leaves a
+    # truncated entry behind
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(orjson.dumps(value))
+    os.replace(tmp_path, path)
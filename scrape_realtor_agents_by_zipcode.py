@@ -1,16 +1,25 @@
 import argparse
+import asyncio
+import gzip
+import hashlib
 import logging
 import os
+import random
 import re
 import time
-import uuid
-from concurrent.futures import ProcessPoolExecutor, as_completed
-
-import pandas as pd
-from bs4 import BeautifulSoup
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date
+
+import aiohttp
+import lxml.html
+import numpy as np
+import orjson
+import pyarrow as pa
+import pyarrow.csv as pacsv
+from aiohttp import ClientSession, TCPConnector
 from dotenv import load_dotenv
+from lxml import etree
 from tqdm import tqdm
-from zenrows import ZenRowsClient
 
 # Load environment variables
 load_dotenv()
@@ -18,134 +27,332 @@ load_dotenv()
 logging.basicConfig(level=logging.INFO, format='%(asctime)s [%(levelname)s] %(message)s')
 logger = logging.getLogger(__name__)
 
-def extract_agent_info(card):
-    agent_info = {}
-
-    # Name
-    name = card.select_one("div.agent-name span.text-bold")
-    agent_info['Name'] = name.get_text(strip=True) if name else ''
-
-    # Profile Picture URL
-    profile_pic = card.select_one("div.agent-list-card-img img.profile-logo")
-    agent_info['Profile Picture URL'] = profile_pic['src'] if profile_pic else ''
-
-    # Company
-    company = card.select_one("div.agent-group div")
-    agent_info['Company'] = company.get_text(strip=True) if company else ''
-
-    # Brokerage Picture URL
-    brokerage_pic = card.select_one("div.agent-office-logo img")
-    agent_info['Brokerage Picture URL'] = brokerage_pic['src'] if brokerage_pic else ''
-
-    # Experience
-    # Look for "Experience: ..." inside a div that contains that text and a bold-text span
-    experience_div = card.find("div", text=re.compile(r'Experience:'))
-    if experience_div:
-        exp_span = experience_div.find("span", class_="bold-text")
-        agent_info['Experience'] = exp_span.get_text(strip=True) if exp_span else ''
-    else:
-        agent_info['Experience'] = ''
+ZENROWS_API_URL = "https://api.zenrows.com/v1/"
+ZENROWS_PARAMS = {"js_render": "true", "premium_proxy": "true", "proxy_country": "us"}
+# Rendered pages are reused from the on-disk cache for up to a week
+PAGE_CACHE_MAX_AGE = 7 * 24 * 3600
+# Rate limiting and transient ZenRows failures are retried with exponential
+# backoff before a page counts as failed
+FETCH_ATTEMPTS = 4
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+RETRY_BACKOFF = 2
+
+# Patterns used for every agent card, compiled once
+RE_FOR_SALE_SOLD = re.compile(r"For sale:\s*(\d+).+Sold:\s*(\d+)")
+RE_NON_DIGIT = re.compile(r'\D')
+# Result count shown above the agent list, e.g. "Showing 1-20 of 1,234 agents"
+RE_TOTAL_AGENTS = re.compile(r'\bof\s+([\d,]+)\s+agents\b|\b([\d,]+)\s+agents\s+found\b', re.IGNORECASE)
+# JSON payload the agent list is rendered from, when the page embeds it
+RE_NEXT_DATA = re.compile(r'<script id="__NEXT_DATA__"[^>]*>(.*?)</script>', re.S)
+# Agent cards rendered on the page, counted without building the DOM
+RE_AGENT_CARD = re.compile(r'data-testid=["\']component-agentCard["\']')
+
+# Output columns, in order, with the value used when a field is missing
+AGENT_FIELD_DEFAULTS = {
+    'Name': '',
+    'Profile Picture URL': '',
+    'Company': '',
+    'Brokerage Picture URL': '',
+    'Experience': '',
+    'Phone': '',
+    'Email Available': 'No',
+    'For Sale': '',
+    'Sold': '',
+    'Reviews': '0',
+    'Recommendations': '0',
+    'Activity Range': '',
+    'Last Listed': '',
+    'Last Sold': '',
+    'Languages': '',
+    'Certifications': '',
+}
+
+# Schema of the per-zipcode output files
+AGENT_SCHEMA = pa.schema([(field, pa.string()) for field in AGENT_FIELD_DEFAULTS])
+
+# Fields shown as "<label> <span class="bold-text">value</span>"
+LABELLED_FIELDS = {
+    'Experience:': 'Experience',
+    'Activity range:': 'Activity Range',
+    'Listed a house:': 'Last Listed',
+    'Sold a house:': 'Last Sold',
+}
+
+def has_class(class_name):
+    # XPath predicate matching one entry of a space-separated class attribute
+    return f"contains(concat(' ', normalize-space(@class), ' '), ' {class_name} ')"
+
+def first_in(outer_tag, outer_class, inner=None):
+    # XPath for the first `inner` element inside the first outer_tag.outer_class,
+    # like select_one("outer_tag.outer_class inner")
+    path = f"(.//{outer_tag}[{has_class(outer_class)}])[1]"
+    return etree.XPath(f"{path}//{inner}" if inner else path)
+
+# XPath expressions for every field, compiled once
+XP_AGENT_CARDS = etree.XPath("//div[@data-testid='component-agentCard']")
+XP_NAME = first_in("div", "agent-name", f"span[{has_class('text-bold')}]")
+XP_PROFILE_PICTURE = first_in("div", "agent-list-card-img", f"img[{has_class('profile-logo')}]")
+XP_COMPANY = first_in("div", "agent-group", "div")
+XP_BROKERAGE_PICTURE = first_in("div", "agent-office-logo", "img")
+XP_PHONE = first_in("div", "agent-phone")
+XP_EMAIL_BUTTON = first_in("span", "agent-email", "button")
+XP_REVIEWS = first_in("span", "agent-reviews")
+XP_RECOMMENDATIONS = first_in("span", "agent-recommand")
+XP_LANGUAGES = first_in("div", "agent-language", f"span[{has_class('bold-text')}]")
+XP_CERTIFICATION_ICONS = first_in("div", "desigations_certifications-icons", "i")
+XP_FOR_SALE_SOLD = etree.XPath(
+    "(.//div[re:test(@class, 'pb-1.*pt-16')])[1]",
+    namespaces={"re": "http://exslt.org/regular-expressions"},
+)
+XP_BOLD_TEXT = etree.XPath(f".//span[{has_class('bold-text')}]")
+# Rendered page text outside the agent cards; script and style contents are
+# not shown and may contain unrelated "of N agents" strings
+XP_PAGE_TEXT = etree.XPath(
+    "//body//text()[not(ancestor::script or ancestor::style or ancestor::noscript"
+    " or ancestor::template or ancestor::div[@data-testid='component-agentCard'])]"
+)
+
+def text_of(elements, separator=''):
+    # Stripped, non-empty text pieces of the first match, joined by separator
+    if not elements:
+        return ''
+    return separator.join(text.strip() for text in elements[0].itertext() if text.strip())
+
+def src_of(elements):
+    return elements[0].get('src', '') if elements else ''
+
+def digits_of(elements):
+    # Extract just the digits, e.g. "1 reviews" -> "1"
+    return RE_NON_DIGIT.sub('', text_of(elements)) or '0'
+
+def yes_no(elements):
+    return 'Yes' if elements else 'No'
+
+def certifications_of(elements):
+    # The icons have classes like "icon-certification-gri", "icon-certification-crs", etc.
+    badges = []
+    for badge_icon in elements:
+        for class_name in badge_icon.get("class", "").split():
+            if class_name.startswith("icon-certification-"):
+                badges.append(class_name.replace("icon-certification-", "").upper())
+    return ', '.join(badges)
+
+# Fields read straight from one XPath: (field, xpath, converter)
+CARD_FIELDS = (
+    ('Name', XP_NAME, text_of),
+    ('Profile Picture URL', XP_PROFILE_PICTURE, src_of),
+    ('Company', XP_COMPANY, text_of),
+    ('Brokerage Picture URL', XP_BROKERAGE_PICTURE, src_of),
+    ('Phone', XP_PHONE, text_of),
+    # Email is only flagged as available when the card has an Email button
+    ('Email Available', XP_EMAIL_BUTTON, yes_no),
+    ('Reviews', XP_REVIEWS, digits_of),
+    ('Recommendations', XP_RECOMMENDATIONS, digits_of),
+    ('Languages', XP_LANGUAGES, text_of),
+    ('Certifications', XP_CERTIFICATION_ICONS, certifications_of),
+)
 
-    # Phone Number
-    phone_number = card.select_one("div.agent-phone")
-    agent_info['Phone'] = phone_number.get_text(strip=True) if phone_number else ''
+def extract_agent_info(card):
+    agent_info = dict(AGENT_FIELD_DEFAULTS)
 
-    # Email (Check if Email button exists)
-    email_button = card.select_one("span.agent-email button")
-    agent_info['Email Available'] = 'Yes' if email_button else 'No'
+    for field, xpath, convert in CARD_FIELDS:
+        agent_info[field] = convert(xpath(card))
 
-    # For Sale and Sold:
-    # They both appear in the same div, something like:
+    # For Sale and Sold appear in the same div, something like:
     # <div class="... pb-1 pt-16">For sale: <span>3</span> Sold: <span>6</span></div>
-    for_sale_sold_div = card.find("div", class_=re.compile(r'pb-1.*pt-16'))
-    if for_sale_sold_div:
-        text = for_sale_sold_div.get_text(" ", strip=True)
-        # Example text: "For sale: 3 Sold: 6"
-        # Use regex to extract the numbers
-        match = re.search(r"For sale:\s*(\d+).+Sold:\s*(\d+)", text)
-        if match:
-            agent_info['For Sale'] = match.group(1)
-            agent_info['Sold'] = match.group(2)
-        else:
-            agent_info['For Sale'] = ''
-            agent_info['Sold'] = ''
-    else:
-        agent_info['For Sale'] = ''
-        agent_info['Sold'] = ''
-
-    # Reviews and Recommendations
-    # They appear as:
-    # <span class="agent-reviews">1 reviews</span> | <span class="agent-recommand">1 recommendations</span>
-    reviews_span = card.select_one("span.agent-reviews")
-    if reviews_span:
-        reviews_text = reviews_span.get_text(strip=True)
-        # Extract just the digit
-        reviews_num = re.sub(r'\D', '', reviews_text)
-        agent_info['Reviews'] = reviews_num if reviews_num else '0'
-    else:
-        agent_info['Reviews'] = '0'
-
-    recomm_span = card.select_one("span.agent-recommand")
-    if recomm_span:
-        recomm_text = recomm_span.get_text(strip=True)
-        # Extract just the digit
-        recomm_num = re.sub(r'\D', '', recomm_text)
-        agent_info['Recommendations'] = recomm_num if recomm_num else '0'
-    else:
-        agent_info['Recommendations'] = '0'
-
-    # Activity Range
-    activity_range_div = card.find("div", text=re.compile(r'Activity range:'))
-    if activity_range_div:
-        activity_range_value = activity_range_div.find("span", class_="bold-text")
-        agent_info['Activity Range'] = activity_range_value.get_text(strip=True) if activity_range_value else ''
-    else:
-        agent_info['Activity Range'] = ''
+    match = RE_FOR_SALE_SOLD.search(text_of(XP_FOR_SALE_SOLD(card), " "))
+    if match:
+        agent_info['For Sale'] = match.group(1)
+        agent_info['Sold'] = match.group(2)
+
+    # The label is the text right before each value span
+    found = set()
+    for span in XP_BOLD_TEXT(card):
+        previous = span.getprevious()
+        label = previous.tail if previous is not None else span.getparent().text
+        field = LABELLED_FIELDS.get(label.strip()) if label else None
+        if field is not None and field not in found:
+            agent_info[field] = text_of([span])
+            found.add(field)
 
-    # Last Listed (Listed a house)
-    listed_date_div = card.find("div", text=re.compile(r'Listed a house:'))
-    if listed_date_div:
-        listed_date_value = listed_date_div.find("span", class_="bold-text")
-        agent_info['Last Listed'] = listed_date_value.get_text(strip=True) if listed_date_value else ''
-    else:
-        agent_info['Last Listed'] = ''
+    return agent_info
 
-    # Last Sold (Sold a house)
-    sold_house_div = card.find("div", text=re.compile(r'Sold a house:'))
-    if sold_house_div:
-        sold_house_value = sold_house_div.find("span", class_="bold-text")
-        agent_info['Last Sold'] = sold_house_value.get_text(strip=True) if sold_house_value else ''
-    else:
-        agent_info['Last Sold'] = ''
+def dig(value, path):
+    # Follow a dotted key path through nested dicts, None if any step is missing
+    for key in path.split('.'):
+        value = value.get(key) if isinstance(value, dict) else None
+    return value
+
+def has_path(value, path):
+    # Whether every key of a dotted path is present; a null along the way
+    # (e.g. "photo": null) counts as present, the value is just empty
+    for key in path.split('.'):
+        if value is None:
+            return True
+        if not isinstance(value, dict) or key not in value:
+            return False
+        value = value[key]
+    return True
+
+def as_text(value):
+    return '' if value is None else str(value)
+
+def count_of(value):
+    return str(value) if value is not None else '0'
+
+def has_value(value):
+    return 'Yes' if value else 'No'
+
+def date_of(value):
+    # "2024-11-01T00:00:00Z" -> "2024-11-01"
+    return value[:10] if isinstance(value, str) else ''
+
+def first_phone(phones):
+    return as_text(phones[0].get('number')) if phones and isinstance(phones[0], dict) else ''
+
+def joined(values):
+    return ', '.join(str(value) for value in values) if isinstance(values, list) else ''
+
+def designations_of(designations):
+    if not isinstance(designations, list):
+        return ''
+    return ', '.join(str(d.get('name', '')).upper() for d in designations if isinstance(d, dict) and d.get('name'))
+
+def money(value):
+    # 100000 -> "$100K", 1500000 -> "$1.5M"; rounded before the unit is
+    # picked, so 999999 -> "$1M" rather than "$1000K"
+    for threshold, suffix in ((1_000_000, 'M'), (1_000, 'K')):
+        scaled = round(value / threshold, 1)
+        if scaled >= 1:
+            return f"${scaled:.1f}".rstrip('0').rstrip('.') + suffix
+    return f"${value:g}"
+
+# Fields read from one key path of an agent in the page's JSON payload:
+# (field, path, converter). Every path has to be present in the payload
+JSON_FIELDS = (
+    ('Name', 'full_name', as_text),
+    ('Profile Picture URL', 'photo.href', as_text),
+    ('Company', 'office.name', as_text),
+    ('Brokerage Picture URL', 'office.photo.href', as_text),
+    ('Phone', 'phones', first_phone),
+    ('Email Available', 'email', has_value),
+    ('For Sale', 'for_sale_price.count', as_text),
+    ('Sold', 'recently_sold.count', as_text),
+    ('Reviews', 'review_count', count_of),
+    ('Recommendations', 'recommendations_count', count_of),
+    ('Last Listed', 'for_sale_price.last_listing_date', date_of),
+    ('Last Sold', 'recently_sold.last_sold_date', date_of),
+    ('Languages', 'languages', joined),
+    ('Certifications', 'designations', designations_of),
+)
+
+def experience_of(agent):
+    # Cards show e.g. "10 years 2 months", which needs both the start year
+    # and month; None when only one of them is there
+    first_year = agent.get('first_year')
+    first_month = agent.get('first_month')
+    if first_year is None and first_month is None:
+        return ''
+    if not isinstance(first_year, int) or not isinstance(first_month, int):
+        return None
+    today = date.today()
+    months = (today.year - first_year) * 12 + today.month - first_month
+    return f"{months // 12} years {months % 12} months"
+
+# Key paths the JSON path relies on besides JSON_FIELDS
+JSON_REQUIRED_PATHS = ('first_year', 'first_month', 'for_sale_price.min', 'for_sale_price.max')
+
+def extract_agent_json(agent):
+    # None when the agent can't be rendered exactly like its card, so the
+    # page is parsed from HTML instead of yielding blank or reformatted fields.
+    # Missing keys mean the payload isn't shaped as expected, so they are
+    # never filled with defaults
+    if not isinstance(agent, dict) or not as_text(agent.get('full_name')).strip():
+        return None
+    paths = [path for _, path, _ in JSON_FIELDS] + list(JSON_REQUIRED_PATHS)
+    if not all(has_path(agent, path) for path in paths):
+        return None
+    experience = experience_of(agent)
+    if experience is None:
+        return None
+
+    agent_info = dict(AGENT_FIELD_DEFAULTS)
+
+    for field, path, convert in JSON_FIELDS:
+        agent_info[field] = convert(dig(agent, path))
+    agent_info['Experience'] = experience
+
+    low = dig(agent, 'for_sale_price.min')
+    high = dig(agent, 'for_sale_price.max')
+    if isinstance(low, (int, float)) and isinstance(high, (int, float)):
+        agent_info['Activity Range'] = f"{money(low)} - {money(high)}"
 
-    # Languages
-    language_div = card.find("div", class_="agent-language")
-    if language_div:
-        lang_span = language_div.find("span", class_="bold-text")
-        agent_info['Languages'] = lang_span.get_text(strip=True) if lang_span else ''
-    else:
-        agent_info['Languages'] = ''
+    return agent_info
 
-    # Certifications
-    # The icons have classes like "icon-certification-gri", "icon-certification-crs", etc.
-    badges = []
-    badge_icons = card.select("div.desigations_certifications-icons i")
-    for badge_icon in badge_icons:
-        badge_class = badge_icon.get("class", [])
-        for class_name in badge_class:
-            if class_name.startswith("icon-certification-"):
-                badge_name = class_name.replace("icon-certification-", "").upper()
-                badges.append(badge_name)
-    agent_info['Certifications'] = ', '.join(badges)
+def parse_next_data(html_content):
+    # Returns (agents, total) from the embedded JSON payload, or None when
+    # the page doesn't carry one, it lists no agents or not one per rendered
+    # card, or any agent in it lacks the fields the cards show, and the HTML
+    # has to be parsed instead
+    match = RE_NEXT_DATA.search(html_content)
+    if not match:
+        return None
+    try:
+        page_props = dig(orjson.loads(match.group(1)), 'props.pageProps')
+    except orjson.JSONDecodeError:
+        return None
+    agents = dig(page_props, 'agents')
+    if not isinstance(agents, list) or not agents:
+        return None
+    if len(agents) != len(RE_AGENT_CARD.findall(html_content)):
+        return None
 
-    return agent_info
-def scrape_realtor_agents(html_content):
-    soup = BeautifulSoup(html_content, 'html.parser')
+    agents_info = []
+    for agent in agents:
+        try:
+            agent_info = extract_agent_json(agent)
+        except Exception as e:
+            logger.warning(f"Falling back to HTML parsing: {e}")
+            return None
+        if agent_info is None:
+            return None
+        agents_info.append(agent_info)
+
+    total = dig(page_props, 'matching_rows')
+    return agents_info, total if isinstance(total, int) else None
+
+def extract_total_agents(tree):
+    match = RE_TOTAL_AGENTS.search(' '.join(XP_PAGE_TEXT(tree)))
+    if not match:
+        return None
+    return int((match.group(1) or match.group(2)).replace(',', ''))
+
+def parse_agents_page(html_content, use_json=True):
+    # Returns the page's agents and the zipcode's total agent count, if shown
+    if not html_content.strip():
+        return [], None
+
+    # Reading the JSON the page is rendered from skips building the DOM
+    if use_json:
+        parsed = parse_next_data(html_content)
+        if parsed is not None:
+            return parsed
+
+    tree = lxml.html.fromstring(html_content)
+    return extract_agents(tree), extract_total_agents(tree)
+
+def check_agents_page(html_content):
+    # Parses the cards like parse_agents_page, and also reports whether the
+    # page's JSON payload gives exactly the same rows, i.e. whether the rest
+    # of the zipcode's pages can be read from the payload
+    agents, total = parse_agents_page(html_content, use_json=False)
+    parsed = parse_next_data(html_content)
+    return agents, total, parsed is not None and parsed[0] == agents
+
+def extract_agents(tree):
     agents_info = []
 
-    agent_cards = soup.select("div[data-testid='component-agentCard']")
-
-    for card in agent_cards:
+    for card in XP_AGENT_CARDS(tree):
         try:
             agent_info = extract_agent_info(card)
             agents_info.append(agent_info)
@@ -154,42 +361,179 @@ def scrape_realtor_agents(html_content):
 
     return agents_info
 
-def scrape_zipcode(zipcode, output_dir, api_key):
-    params = {"js_render": "true", "premium_proxy": "true", "proxy_country": "us"}
-    client = ZenRowsClient(api_key)
+def page_cache_path(cache_dir, url):
+    return os.path.join(cache_dir, f"{hashlib.blake2b(url.encode('utf-8'), digest_size=16).hexdigest()}.html.gz")
+
+def read_cached_page(cache_path):
+    try:
+        if time.time() - os.path.getmtime(cache_path) > PAGE_CACHE_MAX_AGE:
+            return None
+        with gzip.open(cache_path, 'rt', encoding='utf-8') as f:
+            return f.read()
+    except (OSError, EOFError):
+        return None
+
+def write_cached_page(cache_path, html_content):
+    # Write to a temporary file first so an interrupted run never leaves a
+    # truncated page in the cache
+    tmp_path = f"{cache_path}.tmp"
+    with gzip.open(tmp_path, 'wt', encoding='utf-8', compresslevel=5) as f:
+        f.write(html_content)
+    os.replace(tmp_path, cache_path)
+
+def retry_delay(response, attempt):
+    # Honour the server's Retry-After when it gives one in seconds
+    retry_after = response.headers.get('Retry-After', '')
+    if retry_after.isdigit():
+        return int(retry_after)
+    return RETRY_BACKOFF * 2 ** attempt + random.uniform(0, 1)
+
+async def fetch_page(session, request_semaphore, url, api_key, cache_dir):
+    # Re-runs and retries of a zipcode are served from disk instead of
+    # paying for another JavaScript-rendered ZenRows request
+    cache_path = page_cache_path(cache_dir, url)
+    html_content = await asyncio.to_thread(read_cached_page, cache_path)
+    if html_content is not None:
+        return 200, html_content
+
+    params = {"apikey": api_key, "url": url, **ZENROWS_PARAMS}
+    for attempt in range(FETCH_ATTEMPTS):
+        # The semaphore caps ZenRows requests in flight across all zipcodes
+        async with request_semaphore:
+            async with session.get(ZENROWS_API_URL, params=params) as response:
+                status = response.status
+                if status == 200:
+                    html_content = await response.text()
+                    break
+                delay = retry_delay(response, attempt)
+        if status not in RETRY_STATUSES or attempt == FETCH_ATTEMPTS - 1:
+            return status, None
+        logger.warning(f"Got {status} for {url}, retrying in {delay:.1f}s")
+        await asyncio.sleep(delay)
+
+    # Only successful pages are cached, so failures are retried next run
+    await asyncio.to_thread(write_cached_page, cache_path, html_content)
+    return 200, html_content
+
+async def scrape_pages(session, request_semaphore, zipcode, api_key, parse_pool, page_lookahead, cache_dir):
+    # Returns every agent of the zipcode, or None if a page could not be fetched
+    loop = asyncio.get_running_loop()
     base_url = f"https://www.realtor.com/realestateagents/{zipcode}/photo-1"
     page = 1
+    batch_size = 1
+    total_agents = None
+    per_page = None
+    use_json = False
     all_agents = []
 
     while True:
-        url = f"{base_url}/pg-{page}"
-        response = client.get(url, params=params)
-
-        if response.status_code != 200:
-            logger.error(f"Error fetching page {page} for zipcode {zipcode}: {response.status_code}")
-            break
-
-        agents = scrape_realtor_agents(response.text)
-        if not agents:
-            break
-
-        all_agents.extend(agents)
-        page += 1
+        # Fetch page 1 on its own, then request the following pages in
+        # parallel batches so their round-trips overlap
+        pages = range(page, page + batch_size)
+        responses = await asyncio.gather(
+            *(fetch_page(session, request_semaphore, f"{base_url}/pg-{p}", api_key, cache_dir) for p in pages)
+        )
+
+        for p, (status, html_content) in zip(pages, responses):
+            if html_content is None:
+                logger.error(f"Error fetching page {p} for zipcode {zipcode}: {status}")
+                return None
+
+            # Parsing is CPU-bound, so keep it off the event loop. The JSON
+            # payload is only trusted for the later pages once it matched the
+            # cards of page 1
+            if p == 1:
+                agents, page_total, use_json = await loop.run_in_executor(parse_pool, check_agents_page, html_content)
+                if agents and not use_json and '__NEXT_DATA__' in html_content:
+                    logger.warning(f"Page data of zipcode {zipcode} doesn't match its agent cards, parsing HTML")
+            else:
+                agents, _ = await loop.run_in_executor(parse_pool, parse_agents_page, html_content, use_json)
+            if not agents:
+                return all_agents
+
+            all_agents.extend(agents)
+            if p == 1:
+                total_agents = page_total
+                per_page = len(agents)
+
+        # Stop once the advertised total is reached, without requesting an
+        # empty page to find the end
+        if total_agents is not None and len(all_agents) >= total_agents:
+            return all_agents
+
+        batch_size = page_lookahead
+        if total_agents is not None:
+            # The page count is known, so never request past the last page
+            remaining_pages = -(-(total_agents - len(all_agents)) // per_page)
+            batch_size = min(batch_size, remaining_pages)
+        page += len(pages)
+
+def generate_agent_ids(n):
+    # Draw the randomness for every id in one call, then set the RFC 4122
+    # version 4 and variant bits so ids keep the usual uuid4 format
+    raw = np.frombuffer(os.urandom(16 * n), dtype=np.uint8).reshape(n, 16).copy()
+    raw[:, 6] = (raw[:, 6] & 0x0F) | 0x40
+    raw[:, 8] = (raw[:, 8] & 0x3F) | 0x80
+    hexed = raw.tobytes().hex()
+    return [
+        f"{hexed[i:i + 8]}-{hexed[i + 8:i + 12]}-{hexed[i + 12:i + 16]}-{hexed[i + 16:i + 20]}-{hexed[i + 20:i + 32]}"
+        for i in range(0, 32 * n, 32)
+    ]
 
+def save_agents(all_agents, zipcode, output_dir):
     if all_agents:
-        df = pd.DataFrame(all_agents)
-        df['id'] = [str(uuid.uuid4()) for _ in range(len(df))]
+        # Build the table straight from the extracted dicts; no DataFrame needed
+        table = pa.Table.from_pylist(all_agents, schema=AGENT_SCHEMA)
+        table = table.append_column('id', pa.array(generate_agent_ids(len(all_agents)), pa.string()))
         os.makedirs(output_dir, exist_ok=True)
-        df.to_csv(os.path.join(output_dir, f'agents_info_{zipcode}.csv'), index=False, encoding='utf-8')
+        pacsv.write_csv(table, os.path.join(output_dir, f'agents_info_{zipcode}.csv'))
         logger.info(f"Scraped information for {len(all_agents)} agents in zipcode {zipcode}")
     else:
         logger.info(f"No agents found for zipcode {zipcode}")
 
+async def scrape_zipcode(session, semaphore, request_semaphore, zipcode, output_dir, api_key, parse_pool, page_lookahead, cache_dir):
+    async with semaphore:
+        all_agents = await scrape_pages(session, request_semaphore, zipcode, api_key, parse_pool, page_lookahead, cache_dir)
+    if all_agents is None:
+        # Leave no output file behind, so the next run scrapes the zipcode again
+        logger.error(f"Skipping zipcode {zipcode}, its results are incomplete")
+        return
+    await asyncio.to_thread(save_agents, all_agents, zipcode, output_dir)
+
+async def scrape_zipcodes(zipcodes, output_dir, api_key, max_workers, max_requests, page_lookahead, cache_dir):
+    semaphore = asyncio.Semaphore(max_workers)
+    request_semaphore = asyncio.Semaphore(max_requests)
+    # One pooled session serves every page of every zipcode; keep idle
+    # connections and DNS results around long enough to be reused between
+    # slow, JavaScript-rendered responses
+    connector = TCPConnector(limit=max_requests, keepalive_timeout=75, ttl_dns_cache=300)
+    # Rendering pages with JavaScript can take a while on ZenRows' side
+    timeout = aiohttp.ClientTimeout(total=180)
+
+    async with ClientSession(connector=connector, timeout=timeout) as session:
+        with ProcessPoolExecutor() as parse_pool:
+            tasks = [
+                asyncio.create_task(scrape_zipcode(session, semaphore, request_semaphore, zipcode, output_dir, api_key, parse_pool, page_lookahead, cache_dir))
+                for zipcode in zipcodes
+            ]
+
+            # Add progress bar for overall zipcode processing
+            with tqdm(total=len(tasks), desc="Processing zipcodes") as pbar:
+                for future in asyncio.as_completed(tasks):
+                    try:
+                        await future
+                    except Exception as e:
+                        logger.error(f"An error occurred: {e}")
+                    pbar.update(1)
+
 def main():
     parser = argparse.ArgumentParser(description='Scrape realtor.com agent data for given zipcodes.')
     parser.add_argument('zipcodes_file', default='filtered_zipcodes.txt', help='Path to the .txt file containing zipcodes (one per line).')
     parser.add_argument('--output_dir', default='data/realtor_agents', help='Directory to save output CSV files.')
-    parser.add_argument('--max_workers', type=int, default=10, help='Number of parallel workers.')
+    parser.add_argument('--max_workers', type=int, default=50, help='Number of zipcodes to scrape concurrently.')
+    parser.add_argument('--max_requests', type=int, default=10, help='Maximum number of ZenRows requests in flight at once.')
+    parser.add_argument('--page_lookahead', type=int, default=3, help='Number of result pages to request in parallel after the first page.')
+    parser.add_argument('--cache_dir', default='data/zenrows_cache', help='Directory to cache rendered result pages.')
     args = parser.parse_args()
 
     # Get API key from environment variable
@@ -199,17 +543,21 @@ def main():
 
     # Create output directory if it doesn't exist
     os.makedirs(args.output_dir, exist_ok=True)
+    os.makedirs(args.cache_dir, exist_ok=True)
 
     # Read zipcodes from the file
     with open(args.zipcodes_file, 'r') as f:
         zipcodes = [line.strip() for line in f if line.strip()]
 
-    # Filter out already scraped zipcodes
-    existing_files = set(os.listdir(args.output_dir))
-    zipcodes_to_scrape = [
-        zipcode for zipcode in zipcodes 
-        if f'agents_info_{zipcode}.csv' not in existing_files
-    ]
+    # Filter out already scraped zipcodes, reading just the names of the
+    # output files once and comparing zipcodes against that set
+    with os.scandir(args.output_dir) as entries:
+        done_zips = {
+            entry.name[len('agents_info_'):-len('.csv')]
+            for entry in entries
+            if entry.name.startswith('agents_info_') and entry.name.endswith('.csv')
+        }
+    zipcodes_to_scrape = [zipcode for zipcode in zipcodes if zipcode not in done_zips]
 
     if not zipcodes_to_scrape:
         logger.info("All zipcodes have already been scraped!")
@@ -218,23 +566,10 @@ def main():
     logger.info(f"Found {len(zipcodes_to_scrape)} zipcodes to scrape out of {len(zipcodes)} total zipcodes")
     start_time = time.time()
 
-    # Add progress bar for overall zipcode processing
-    with tqdm(total=len(zipcodes_to_scrape), desc="Processing zipcodes") as pbar:
-        # Use ProcessPoolExecutor to process zipcodes in parallel
-        with ProcessPoolExecutor(max_workers=args.max_workers) as executor:
-            futures = []
-            for zipcode in zipcodes_to_scrape:
-                futures.append(executor.submit(scrape_zipcode, zipcode, args.output_dir, api_key))
-
-            for future in as_completed(futures):
-                try:
-                    future.result()
-                except Exception as e:
-                    logger.error(f"An error occurred: {e}")
-                pbar.update(1)
+    asyncio.run(scrape_zipcodes(zipcodes_to_scrape, args.output_dir, api_key, args.max_workers, args.max_requests, args.page_lookahead, args.cache_dir))
 
     end_time = time.time()
     logger.info(f"Total execution time: {end_time - start_time:.2f} seconds")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -1,122 +1,143 @@
 import asyncio
 import glob
-import json
 import os
 import random
-from typing import List, Optional
 
-import aiofiles
-import pandas as pd
+import httpx
+from aiolimiter import AsyncLimiter
 from openai import AsyncOpenAI
-from pydantic import BaseModel, Field
+from pydantic import ValidationError
+
+import llm_cache
+from agent_extraction import (AGENT_DATA_ADAPTER, AGENT_DATA_SCHEMA,
+                              FALLBACK_MODEL, MAX_TOKENS, MODEL, PATH_INPUT,
+                              PATH_OUTPUT, PATH_SEARCH_RESULTS,
+                              RESPONSE_FORMAT, SYSTEM_PROMPT, build_messages,
+                              build_search_query, build_user_prompt,
+                              load_agent_rows, load_processed_agents,
+                              needs_fallback, read_json, write_json)
+
+try:
+    # Faster event loop for the many concurrent HTTP requests; not available on Windows
+    import uvloop
+except ImportError:
+    uvloop = None
+
+# Pace requests to stay under the account's per-minute limits instead of
+# bursting into 429s and the SDK's retry backoff; match these to the tier
+OPENAI_RPM = 500
+OPENAI_TPM = 800_000
+REQUEST_LIMITER = AsyncLimiter(OPENAI_RPM, 60)
+TOKEN_LIMITER = AsyncLimiter(OPENAI_TPM, 60)
+
+# One client for the whole run, so every agent reuses pooled keep-alive
+# connections instead of opening a new pool and TLS session per request.
+# Created on first use, so importing this module needs no OPENAI_API_KEY
+CLIENT = None
+
+
+def get_client():
+    global CLIENT
+    if CLIENT is None:
+        CLIENT = AsyncOpenAI(http_client=httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=200, max_keepalive_connections=100),
+            timeout=httpx.Timeout(120.0, connect=10.0),
+        ))
+    return CLIENT
+
+
+# Ids of agents with an output file, filled in by main() and kept up to date
+# as results are written
+PROCESSED_AGENTS = set()
+# Requests currently in flight, by cache key
+INFLIGHT = {}
+# Number of agents retried with FALLBACK_MODEL, to tune when it kicks in
+FALLBACK_COUNT = 0
+
+
+async def request_agent_data(user_prompt, model):
+    # OpenAI counts the prompt plus max_tokens against the token limit;
+    # roughly four characters per prompt token
+    estimated_tokens = (len(SYSTEM_PROMPT) + len(user_prompt)) // 4 + MAX_TOKENS
+    await REQUEST_LIMITER.acquire()
+    await TOKEN_LIMITER.acquire(min(estimated_tokens, OPENAI_TPM))
+
+    completion = await get_client().chat.completions.create(
+        model=model,
+        temperature=0,
+        max_tokens=MAX_TOKENS,
+        messages=build_messages(user_prompt),
+        response_format=RESPONSE_FORMAT
+    )
 
-PATH_INPUT = 'data/realtor_agents_enhanced'
-PATH_SEARCH_RESULTS = 'data/clean_google_searches'
-PATH_OUTPUT = 'data/parsed_search_results'
+    message = completion.choices[0].message
+    if message.refusal:
+        print(f"Model refused to respond: {message.refusal}")
+        return None
 
-if not os.path.exists(PATH_OUTPUT):
-    os.makedirs(PATH_OUTPUT)
-    print(f"Created directory: {PATH_OUTPUT}")
-else:
-    print(f"Directory already exists: {PATH_OUTPUT}")
+    return AGENT_DATA_ADAPTER.validate_json(message.content)
 
-PROCESSED_AGENTS = set()
-for file in os.listdir(PATH_OUTPUT):
-    PROCESSED_AGENTS.add(file.split('.')[0])
 
+async def request_with_fallback(user_prompt):
+    global FALLBACK_COUNT
+    try:
+        agent_data = await request_agent_data(user_prompt, MODEL)
+    except ValidationError as e:
+        if MODEL == FALLBACK_MODEL:
+            raise
+        print(f"Invalid {MODEL} output: {str(e)}")
+        agent_data = None
+
+    if MODEL == FALLBACK_MODEL or not needs_fallback(agent_data, user_prompt):
+        return agent_data
 
-class AgentData(BaseModel):
-    email: Optional[str] = Field(
-        None,
-        description="The most relevant real estate agent's professional email address, if available"
-    )
-    other_emails: Optional[List[str]] = Field(
-        None,
-        description="Any other email addresses found for the real estate agent or its brokerage firm"
-    )
-    possible_email: Optional[str] = Field(
-        None,
-        description="The most likely email address for the real estate agent if its main email is not available"
-    )
-    phone: Optional[str] = Field(
-        None,
-        description="The most relevant real estate agent's professional phone number or its brokerage firm, if available"
-    )
-    other_phones: Optional[List[str]] = Field(
-        None,
-        description="Any other contact phone numbers for the real estate agent"
-    )
-    city: Optional[str] = Field(
-        None,
-        description="The city where the real estate agent primarily operates"
-    )
-    age: Optional[int] = Field(
-        None, description="The age of the real estate agent, if available"
-    )
-    gender: Optional[str] = Field(
-        None, description="The gender of the real estate agent, if available"
-    )
-    website: Optional[str] = Field(
-        None,
-        description="The real estate agent's professional website or listing page"
-    )
-    social_media: Optional[List[str]] = Field(
-        None,
-        description="List of social media profiles related to the agent's real estate business"
-    )
-    google_review_star_rating: Optional[float] = Field(
-        None,
-        description="The Google review star rating of the real estate agent or the brokerage firm, if available"
-    )
-    most_recent_reviews: Optional[List[str]] = Field(
-        None,
-        description="The most recent reviews of the real estate agent, if available"
-    )
-    additional_info: Optional[str] = Field(
-        None,
-        description="Relevant information about the real estate agent or their practice that might be interesting to know before contacting them with a personalized message so that they are more likely to respond"
-    )
+    FALLBACK_COUNT += 1
+    return await request_agent_data(user_prompt, FALLBACK_MODEL) or agent_data
 
 
-async def extract_search_results(agent_id, search_query, google_search_results):
-    filename = f"{agent_id}.json"
-    filepath = os.path.join(PATH_OUTPUT, filename)
+async def request_shared(cache_key, user_prompt, semaphore):
+    # Agents with the same prompt wait on the first one's request instead of
+    # sending their own
+    if cache_key in INFLIGHT:
+        return await INFLIGHT[cache_key]
 
-    if os.path.exists(filepath):
-        print(f"Skipping agent_id: {agent_id} (already processed)")
-        return None
-
-    client = AsyncOpenAI()
+    future = asyncio.get_running_loop().create_future()
+    INFLIGHT[cache_key] = future
+    agent_data = None
     try:
-        completion = await client.beta.chat.completions.parse(
-            model='gpt-4o',
-            temperature=0,
-            max_tokens=4096,
-            messages=[
-                {
-                    "role": "system",
-                    "content": "You're a master at finding relevant real estate agent information. You stick to the provided Google search data, and only if explicitly available extract data as valid JSON according to the provided schema."
-                },
-                {
-                    "role": "user",
-                    "content": f"When searching for the following real estate agent on Google: {search_query}, we got these results:\n{google_search_results}.\nExtract the relevant information found as valid JSON:"
-                }
-            ],
-            response_format=AgentData
-        )
+        async with semaphore:
+            agent_data = await request_with_fallback(user_prompt)
+        if agent_data is not None:
+            await asyncio.to_thread(llm_cache.put_entry, cache_key, agent_data.model_dump(mode='json'))
+    finally:
+        # Waiters of a failed request get None and are reported as not processed
+        future.set_result(agent_data)
+        del INFLIGHT[cache_key]
+    return agent_data
+
 
-        if completion.choices[0].message.refusal:
-            print(f"Model refused to respond: {completion.choices[0].message.refusal}")
-            return None
+async def extract_search_results(agent_id, search_query, google_search_results, semaphore):
+    filepath = os.path.join(PATH_OUTPUT, f"{agent_id}.json")
 
-        agent_data = completion.choices[0].message.parsed
+    user_prompt = build_user_prompt(search_query, google_search_results)
+    # Re-runs and duplicate agents produce identical prompts; reuse the
+    # stored answer instead of paying for another completion
+    cache_key = llm_cache.make_key(MODEL, SYSTEM_PROMPT, user_prompt, AGENT_DATA_SCHEMA)
+
+    try:
+        cached = await asyncio.to_thread(llm_cache.get_entry, cache_key)
+        if cached is not None:
+            agent_data = AGENT_DATA_ADAPTER.validate_python(cached)
+        else:
+            agent_data = await request_shared(cache_key, user_prompt, semaphore)
+            if agent_data is None:
+                return None
 
-        # Use aiofiles for async file writing
-        async with aiofiles.open(filepath, 'w', encoding='utf-8') as f:
-            await f.write(json.dumps(agent_data.model_dump(), indent=2))
+        await asyncio.to_thread(write_json, filepath, agent_data.model_dump(mode='json'))
+        PROCESSED_AGENTS.add(agent_id)
 
         print(f"Processed agent_id: {agent_id}")
-        return agent_data
+        return agent_id
 
     except Exception as e:
         print(f"Error processing agent_id {agent_id}: {str(e)}")
@@ -129,77 +150,78 @@ async def process_agent(row, semaphore):
         print(f"Skipping agent_id: {agent_id} (already processed)")
         return None
 
-    name = row['Name']
-    firm_name = row['Company'] if pd.notna(row['Company']) else ''
-    city = row['City'] if pd.notna(row['City']) else ''
-    county = row['County'] if pd.notna(row['County']) else ''
-
-    search_query_dict = {
-        "name": name,
-        "firm_name": firm_name,
-        "city": city,
-        "county": county,
-        "state": "North Dakota"
-    }
-
-    search_query_dict = {k: v for k, v in search_query_dict.items() if v}
-    search_query_dict["keyword"] = "real estate"
-    search_query = " ".join(search_query_dict.values()).strip()
+    search_query = build_search_query(row)
 
     search_results_file = os.path.join(PATH_SEARCH_RESULTS, f"{agent_id}.json")
     try:
-        async with aiofiles.open(search_results_file, 'r', encoding='utf-8') as f:
-            content = await f.read()
-            google_search_results = json.loads(content)
+        google_search_results = await asyncio.to_thread(read_json, search_results_file)
     except FileNotFoundError:
         print(f"Search results file not found for agent ID: {agent_id}")
         return None
 
-    async with semaphore:
-        return await extract_search_results(agent_id, search_query, google_search_results)
+    return await extract_search_results(agent_id, search_query, google_search_results, semaphore)
 
 
-async def process_csv_file(csv_file, semaphore):
-    df = pd.read_csv(csv_file)
-    if df.empty:
-        print(f"CSV file {csv_file} is empty.")
-        return []
+async def produce_rows(csv_files, queue, num_workers):
+    for csv_file in csv_files:
+        try:
+            rows = await asyncio.to_thread(load_agent_rows, csv_file)
+        except Exception as e:
+            print(f"Error processing CSV file {csv_file}: {str(e)}")
+            continue
+        for row in rows:
+            await queue.put(row)
+
+    # One stop marker per worker
+    for _ in range(num_workers):
+        await queue.put(None)
 
-    df_relevant = df[['id', 'Name', 'Company', 'City', 'County']]
-    tasks = [process_agent(row, semaphore) for _, row in df_relevant.iterrows()]
-    results = []
 
-    for coro in asyncio.as_completed(tasks):
+async def consume_rows(queue, semaphore):
+    # Returns how many agents this worker processed
+    processed = 0
+    while (row := await queue.get()) is not None:
         try:
-            result = await coro
-            if result is not None:
-                results.append(result)
+            if await process_agent(row, semaphore) is not None:
+                processed += 1
         except Exception as e:
             print(f"Error processing agent: {str(e)}")
-
-    return results
+    return processed
 
 
 async def main(sample_file_size=None):
+    global CLIENT
+    PROCESSED_AGENTS.update(load_processed_agents())
     csv_files = glob.glob(os.path.join(PATH_INPUT, '*.csv'))
 
     if sample_file_size:
         csv_files = random.sample(csv_files, sample_file_size)
 
-    # Limit concurrent API calls to OpenAI
-    semaphore = asyncio.Semaphore(10)  # Adjust based on API limits
+    # Limit concurrent API calls to OpenAI across all files
+    semaphore = asyncio.Semaphore(50)  # Adjust based on API limits
+    # A fixed pool of workers pulls agents from a bounded queue, so only a
+    # few hundred rows and search results are held in memory at any time;
+    # more workers than API slots keeps cache hits from waiting on requests
+    num_workers = 100
+    queue = asyncio.Queue(maxsize=200)
 
-    all_results = []
-    for csv_file in csv_files: 
-        try:
-            results = await process_csv_file(csv_file, semaphore)
-            all_results.extend(results)
-        except Exception as e:
-            print(f"Error processing CSV file {csv_file}: {str(e)}")
-            continue
+    try:
+        _, *processed = await asyncio.gather(
+            produce_rows(csv_files, queue, num_workers),
+            *(consume_rows(queue, semaphore) for _ in range(num_workers))
+        )
+    finally:
+        if CLIENT is not None:
+            await CLIENT.close()
+            CLIENT = None
 
-    print(f"Processed {len(all_results)} agents successfully")
+    print(f"Processed {sum(processed)} agents successfully")
+    if FALLBACK_COUNT:
+        print(f"Retried {FALLBACK_COUNT} agents with {FALLBACK_MODEL}")
 
 
 if __name__ == '__main__':
-    asyncio.run(main(sample_file_size=None))
\ No newline at end of file
+    if uvloop is not None:
+        uvloop.run(main(sample_file_size=None))
+    else:
+        asyncio.run(main(sample_file_size=None))
@@ -0,0 +1,228 @@
+import argparse
+import glob
+import os
+import random
+import time
+
+import orjson
+from openai import OpenAI
+
+import llm_cache
+from agent_extraction import (AGENT_DATA_ADAPTER, AGENT_DATA_SCHEMA,
+                              FALLBACK_MODEL, MAX_TOKENS, MODEL, PATH_INPUT,
+                              PATH_OUTPUT, PATH_SEARCH_RESULTS,
+                              RESPONSE_FORMAT, SYSTEM_PROMPT, build_messages,
+                              build_search_query, build_user_prompt,
+                              load_agent_rows, load_processed_agents,
+                              needs_fallback, read_json, write_json)
+
+PATH_BATCHES = 'data/llm_batches'
+
+# Limits of a single Batch API input file, with some headroom on the size
+BATCH_MAX_REQUESTS = 50000
+BATCH_MAX_BYTES = 190 * 1024 * 1024
+POLL_INTERVAL = 60
+
+# Ids of agents with an output file, filled in by main()
+PROCESSED_AGENTS = set()
+
+
+def collect_pending_agents(csv_files):
+    pending = []
+    for csv_file in csv_files:
+        try:
+            rows = load_agent_rows(csv_file)
+        except Exception as e:
+            print(f"Error processing CSV file {csv_file}: {str(e)}")
+            continue
+
+        for row in rows:
+            agent_id = row['id']
+            if agent_id in PROCESSED_AGENTS:
+                continue
+            try:
+                google_search_results = read_json(os.path.join(PATH_SEARCH_RESULTS, f"{agent_id}.json"))
+            except FileNotFoundError:
+                print(f"Search results file not found for agent ID: {agent_id}")
+                continue
+
+            user_prompt = build_user_prompt(build_search_query(row), google_search_results)
+            cache_key = llm_cache.make_key(MODEL, SYSTEM_PROMPT, user_prompt, AGENT_DATA_SCHEMA)
+            pending.append((agent_id, cache_key, user_prompt))
+
+    return pending
+
+
+def write_cached_agents(pending):
+    # Write every agent whose answer is already cached and return the rest
+    remaining = []
+    for agent_id, cache_key, user_prompt in pending:
+        cached = llm_cache.get_entry(cache_key)
+        if cached is None:
+            remaining.append((agent_id, cache_key, user_prompt))
+            continue
+        agent_data = AGENT_DATA_ADAPTER.validate_python(cached)
+        write_json(os.path.join(PATH_OUTPUT, f"{agent_id}.json"), agent_data.model_dump(mode='json'))
+        PROCESSED_AGENTS.add(agent_id)
+
+    return remaining
+
+
+def build_request_lines(prompts, model):
+    # One request per distinct prompt; the cache key doubles as custom_id, so
+    # results land in the LLM cache and every agent sharing it is served from there
+    lines = []
+    for cache_key, user_prompt in prompts.items():
+        lines.append(orjson.dumps({
+            "custom_id": cache_key,
+            "method": "POST",
+            "url": "/v1/chat/completions",
+            "body": {
+                "model": model,
+                "temperature": 0,
+                "max_tokens": MAX_TOKENS,
+                "messages": build_messages(user_prompt),
+                "response_format": RESPONSE_FORMAT,
+            },
+        }))
+
+    return lines
+
+
+def split_batches(lines):
+    chunk, chunk_bytes = [], 0
+    for line in lines:
+        if chunk and (len(chunk) >= BATCH_MAX_REQUESTS or chunk_bytes + len(line) + 1 > BATCH_MAX_BYTES):
+            yield chunk
+            chunk, chunk_bytes = [], 0
+        chunk.append(line)
+        chunk_bytes += len(line) + 1
+    if chunk:
+        yield chunk
+
+
+def submit_batches(client, lines, model):
+    os.makedirs(PATH_BATCHES, exist_ok=True)
+    batch_ids = []
+    for i, chunk in enumerate(split_batches(lines)):
+        path = os.path.join(PATH_BATCHES, f"requests_{int(time.time())}_{i}.jsonl")
+        with open(path, 'wb') as f:
+            f.write(b'\n'.join(chunk) + b'\n')
+
+        with open(path, 'rb') as f:
+            input_file = client.files.create(file=f, purpose='batch')
+        batch = client.batches.create(
+            input_file_id=input_file.id,
+            endpoint='/v1/chat/completions',
+            completion_window='24h',
+            # Lets collect_batch tell fallback batches apart when resuming
+            metadata={'model': model}
+        )
+        print(f"Submitted batch {batch.id} with {len(chunk)} requests")
+        batch_ids.append(batch.id)
+
+    return batch_ids
+
+
+def collect_batch(client, batch_id):
+    # Returns the batch's model and the answer for every request that got a
+    # response, with None for refusals and invalid output
+    while True:
+        batch = client.batches.retrieve(batch_id)
+        if batch.status in ('completed', 'failed', 'expired', 'cancelled'):
+            break
+        print(f"Batch {batch_id} is {batch.status}, waiting...")
+        time.sleep(POLL_INTERVAL)
+
+    if batch.status != 'completed':
+        print(f"Batch {batch_id} ended with status: {batch.status}")
+    # Expired and cancelled batches still return the requests that finished
+    model = (batch.metadata or {}).get('model', MODEL)
+    results = {}
+    if not batch.output_file_id:
+        return model, results
+
+    for line in client.files.content(batch.output_file_id).content.splitlines():
+        result = orjson.loads(line)
+        response = result.get('response') or {}
+        if response.get('status_code') != 200:
+            print(f"Request {result['custom_id']} failed: {result.get('error') or response.get('body')}")
+            continue
+
+        agent_data = None
+        message = response['body']['choices'][0]['message']
+        if message.get('refusal'):
+            print(f"Model refused to respond: {message['refusal']}")
+        else:
+            try:
+                agent_data = AGENT_DATA_ADAPTER.validate_json(message['content'])
+            except Exception as e:
+                print(f"Error parsing result {result['custom_id']}: {str(e)}")
+        results[result['custom_id']] = agent_data
+
+    print(f"Collected {len(results)} results from batch {batch_id}")
+    return model, results
+
+
+def store_results(model, results, prompts, first_answers):
+    # The live run serves these cache entries without checking them again, so
+    # only cache answers that need no fallback; return the rest for a
+    # FALLBACK_MODEL batch
+    retry = {}
+    for cache_key, agent_data in results.items():
+        user_prompt = prompts.get(cache_key)
+        if user_prompt is None:
+            # No pending agent left to check the answer against
+            continue
+        if model != FALLBACK_MODEL and needs_fallback(agent_data, user_prompt):
+            retry[cache_key] = agent_data
+            continue
+        # As in the live run, keep the first answer if the fallback has none
+        agent_data = agent_data or first_answers.get(cache_key)
+        if agent_data is not None:
+            llm_cache.put_entry(cache_key, agent_data.model_dump(mode='json'))
+
+    return retry
+
+
+def run_batches(client, prompts, model, first_answers):
+    retry = {}
+    for batch_id in submit_batches(client, build_request_lines(prompts, model), model):
+        retry.update(store_results(*collect_batch(client, batch_id), prompts, first_answers))
+    return retry
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Structure agent search results with the OpenAI Batch API.')
+    parser.add_argument('--sample_file_size', type=int, help='Only process this many randomly chosen CSV files.')
+    parser.add_argument('--batch_ids', nargs='+', help='Collect the results of already submitted batches instead of submitting new ones; only their fallback requests are submitted.')
+    args = parser.parse_args()
+
+    client = OpenAI()
+    PROCESSED_AGENTS.update(load_processed_agents())
+
+    csv_files = glob.glob(os.path.join(PATH_INPUT, '*.csv'))
+    if args.sample_file_size:
+        csv_files = random.sample(csv_files, args.sample_file_size)
+
+    pending = collect_pending_agents(csv_files)
+    prompts = {cache_key: user_prompt for _, cache_key, user_prompt in pending}
+
+    retry = {}
+    for batch_id in args.batch_ids or ():
+        retry.update(store_results(*collect_batch(client, batch_id), prompts, {}))
+    remaining = write_cached_agents(pending)
+
+    if remaining and not args.batch_ids:
+        retry = run_batches(client, {cache_key: prompts[cache_key] for _, cache_key, _ in remaining}, MODEL, {})
+
+    if retry:
+        print(f"Retrying {len(retry)} requests with {FALLBACK_MODEL}")
+        run_batches(client, {cache_key: prompts[cache_key] for cache_key in retry}, FALLBACK_MODEL, retry)
+    remaining = write_cached_agents(remaining)
+
+    print(f"Processed {len(pending) - len(remaining)} agents successfully, {len(remaining)} without a result")
+
+
+if __name__ == '__main__':
+    main()